@@ -16,17 +16,30 @@ Example:
 
 import os
 import sys
+import queue
+import threading
 import logging
+import hashlib
+import io
+import itertools
 import json
+import mmap
 import unicodedata
 import argparse
+import codecs
+import contextlib
+import re
+import tarfile
 import zipfile
+import xml.etree.ElementTree as ElementTree
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
 
 # Optional parsing libraries
 try:
-    import docx  # For .docx
+    from lxml import etree as lxml_etree  # Faster .docx parsing
 except ImportError:
-    docx = None
+    lxml_etree = None
 
 try:
     import fitz  # PyMuPDF
@@ -44,10 +57,35 @@ except ImportError:
     openpyxl = None
 
 try:
-    import odf.text, odf.teletype, odf.opendocument  # For .odt
+    import odf.element, odf.opendocument  # For .odt
 except ImportError:
     odf = None
 
+try:
+    import numpy as np  # Vectorized sanitizing of large non-ASCII texts
+except ImportError:
+    np = None
+
+try:
+    import charset_normalizer  # Encoding detection for non-UTF-8 plaintext
+except ImportError:
+    charset_normalizer = None
+
+try:
+    import orjson  # Faster .ipynb parsing
+except ImportError:
+    orjson = None
+
+try:
+    from isal import isal_zlib  # ISA-L (SIMD) DEFLATE and CRC-32 for --zip
+except ImportError:
+    isal_zlib = None
+
+try:
+    import zstandard  # For --zip-format zstd
+except ImportError:
+    zstandard = None
+
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s [%(levelname)s] %(message)s",
@@ -55,241 +93,875 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# PDF/DOCX/XLSX parsing is CPU-bound; beyond ~6 workers the gains flatten out.
+DEFAULT_WORKERS = min(os.cpu_count() or 1, 6)
+
+# Output files are written through a 1 MB buffer rather than the default 8 KB.
+_WRITE_BUFFER_SIZE = 1 << 20
+
+# Kept in the output directory; remembers which sources were already converted.
+CACHE_FILE_NAME = ".files_2_zip_cache.sqlite"
+
+_PLAINTEXT_EXTS = frozenset((
+    ".txt", ".md", ".py", ".json", ".csv", ".tsv", ".log", ".xml",
+    ".yaml", ".yml", ".html", ".htm", ".css", ".js", ".jsx", ".ts",
+    ".tsx", ".sh", ".cmd", ".ps1", ".swift", ".kt", ".go", ".rs",
+    ".lua", ".pl", ".r", ".m", ".vb", ".cs", ".asm", ".dart",
+    ".php", ".rb", ".sql"
+))
+
+# File category -> extensions. Extraction dispatches on the category.
+_EXT_CATEGORIES = {
+    "plaintext": _PLAINTEXT_EXTS,
+    "pdf": (".pdf",),
+    "docx": (".docx",),
+    "odt": (".odt",),
+    "excel": (".xlsx", ".xls", ".xlsm", ".ods"),
+    "ipynb": (".ipynb",),
+    "unsupported": (".doc", ".rtf", ".ppt", ".pptx", ".odp"),
+}
+
+# One compiled pattern classifies a file name in a single pass: the named
+# group that matched (m.lastgroup) is its category.
+_EXT_RE = re.compile(
+    r"\.(?:%s)\Z" % "|".join(
+        "(?P<%s>%s)" % (category, "|".join(re.escape(ext[1:]) for ext in sorted(exts)))
+        for category, exts in _EXT_CATEGORIES.items()
+    ),
+    re.IGNORECASE,
+)
 
-def sanitize_text(text):
+_TXT_RE = re.compile(r"\.txt\Z")
+
+# Leading bytes expected for each container format, so a corrupt or mis-named
+# file is skipped before a parser spends time failing on it.
+_PDF_MAGIC = b"%PDF"
+_ZIP_MAGIC = b"PK\x03\x04"
+_SIGNATURES = {
+    "pdf": (_PDF_MAGIC,),
+    "docx": (_ZIP_MAGIC,),
+    "odt": (_ZIP_MAGIC,),
+    "excel": (_ZIP_MAGIC, b"\xd0\xcf\x11\xe0"),  # .xls is an OLE2 compound file
+}
+# PDF readers accept the %PDF header anywhere in the first 1 KB
+_SIGNATURE_PEEK = 1024
+
+# Any byte other than printable ASCII, tab or LF (CR needs newline translation)
+_UNCLEAN_BYTES_RE = re.compile(rb"[^\t\n\x20-\x7e]")
+_NON_SPACE_BYTES_RE = re.compile(rb"[^\t\n ]")
+
+# Tried before open-ended detection when plaintext is not valid UTF-8
+_WESTERN_ENCODINGS = ["cp1252", "latin_1"]
+# Valid non-ASCII UTF-8 characters per invalid sequence for a file to be
+# treated as UTF-8 with a few stray bytes rather than another encoding
+_UTF8_MIN_VALID_PER_BAD = 10
+
+# Plaintext files above this size are decoded and sanitized in chunks.
+_PLAINTEXT_STREAM_MIN_BYTES = 1 << 20
+_DECODE_CHUNK_SIZE = 1 << 16
+
+# Read-only openpyxl pads every row to the sheet's declared width and emits
+# empty rows up to its declared height. Declared sizes beyond the old .xls
+# limits are often bogus (some exporters write A1:XFD1048576), so they are
+# not trusted.
+_EXCEL_MAX_TRUSTED_COLS = 256
+_EXCEL_MAX_TRUSTED_ROWS = 65536
+
+_W_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_W_P, _W_R, _W_T = _W_NS + "p", _W_NS + "r", _W_NS + "t"
+# Run children that contribute text besides <w:t>
+_W_RUN_CHARS = {_W_NS + "tab": "\t", _W_NS + "br": "\n", _W_NS + "cr": "\n"}
+
+_ODF_TEXT_NS = "urn:oasis:names:tc:opendocument:xmlns:text:1.0"
+# Elements followed by a newline, and inline elements that stand for characters
+_ODF_BLOCKS = {(_ODF_TEXT_NS, "p"), (_ODF_TEXT_NS, "h")}
+_ODF_CHARS = {(_ODF_TEXT_NS, "tab"): "\t", (_ODF_TEXT_NS, "line-break"): "\n"}
+_ODF_SPACE = (_ODF_TEXT_NS, "s")
+
+
+class _SanitizeTable(dict):
     """
-    Remove or replace odd/control characters and ensure UTF-8 friendly content.
-    - Normalize unicode to NFC form.
-    - Remove non-printable control characters except for newlines/tabs.
+    str.translate() table mapping non-printable characters (other than
+    newlines/tabs) to a space. Entries are filled in on first lookup, so the
+    table only ever holds the codepoints actually seen.
     """
-    text = unicodedata.normalize("NFC", text)
-    cleaned_chars = []
-    for ch in text:
-        if ch.isprintable() or ch in ['\n', '\r', '\t']:
-            cleaned_chars.append(ch)
+
+    def __missing__(self, codepoint):
+        ch = chr(codepoint)
+        if ch.isprintable() or ch in "\n\r\t":
+            self[codepoint] = codepoint
         else:
-            cleaned_chars.append(" ")
-    sanitized = "".join(cleaned_chars).strip()
-    return sanitized
+            self[codepoint] = 0x20
+        return self[codepoint]
+
+
+_SANITIZE_TABLE = _SanitizeTable()
 
+# Non-printable characters commonly found in extracted text: C0/C1 controls,
+# no-break and other Unicode spaces, zero-width/bidi marks, ideographic space
+# and the BOM. Listed one by one so the regex compiles to a bitmap lookup
+# (a class made of hundreds of ranges is matched range by range, ~10x slower).
+_COMMON_NONPRINTABLE_RE = re.compile("[%s]" % "".join(
+    re.escape(chr(cp)) for cp in itertools.chain(range(0x2070), (0x3000, 0xFEFF))
+    if not chr(cp).isprintable() and chr(cp) not in "\n\r\t"
+))
 
-def extract_text_from_file(filepath):
+
+# Below this many characters the NumPy path is not worth the round trip.
+_NUMPY_MIN_CHARS = 1 << 16
+_numpy_allowed = None  # bool per codepoint, built on first use
+
+
+def _sanitize_numpy(text):
     """
-    Attempt to extract text from the given filepath, based on extension.
-    Return an empty string if no parser is available or if an error occurs.
+    Vectorized text.translate(_SANITIZE_TABLE): one table lookup per codepoint
+    in C. For non-ASCII text this is several times faster than translate(),
+    whose dict lookups dominate; ASCII text is faster with translate().
     """
-    ext = os.path.splitext(filepath)[1].lower()
-
-    if ext in (
-        ".txt", ".md", ".py", ".json", ".csv", ".tsv", ".log", ".xml",
-        ".yaml", ".yml", ".html", ".htm", ".css", ".js", ".jsx", ".ts",
-        ".tsx", ".sh", ".cmd", ".ps1", ".swift", ".kt", ".go", ".rs",
-        ".lua", ".pl", ".r", ".m", ".vb", ".cs", ".asm", ".dart",
-        ".php", ".rb", ".sql"
-    ):
-        return _read_plaintext(filepath)
-
-    if ext == ".docx":
-        return _read_docx(filepath) if docx else ""
-
-    if ext in (".doc", ".rtf"):
-        logger.warning("Native reading not implemented for %s; consider external tools.", ext)
-        return ""
-
-    if ext == ".pdf":
-        if fitz:
-            return _read_pdf_pymupdf(filepath)
-        elif PyPDF2:
-            return _read_pdf_pypdf2(filepath)
-        else:
-            logger.warning("No PDF library installed; cannot parse PDFs.")
-            return ""
+    global _numpy_allowed
+    if _numpy_allowed is None:
+        allowed = np.fromiter(
+            (chr(cp).isprintable() for cp in range(sys.maxunicode + 1)),
+            dtype=bool, count=sys.maxunicode + 1,
+        )
+        allowed[[ord("\t"), ord("\n"), ord("\r")]] = True
+        _numpy_allowed = allowed
+    codepoints = np.frombuffer(text.encode("utf-32-le", "surrogatepass"), dtype=np.uint32).copy()
+    codepoints[~_numpy_allowed[codepoints]] = 0x20
+    return codepoints.tobytes().decode("utf-32-le")
+
+
+def _sanitize_chunk(text):
+    """sanitize_text() without the final strip, for streamed pieces of a document."""
+    if text.isascii():
+        # ASCII is already NFC; str.isascii() is a flag check, not a scan
+        return text.translate(_SANITIZE_TABLE)
+    text = unicodedata.normalize("NFC", text)
+    # Replace the usual offenders with one C-level regex pass; if nothing
+    # non-printable is left (the common case) the text is done.
+    text = _COMMON_NONPRINTABLE_RE.sub(" ", text)
+    if text.replace("\n", "").replace("\r", "").replace("\t", "").isprintable():
+        return text
+    if np is not None and len(text) >= _NUMPY_MIN_CHARS:
+        return _sanitize_numpy(text)
+    return text.translate(_SANITIZE_TABLE)
 
-    if ext == ".odt":
-        return _read_odt(filepath) if odf else ""
 
-    if ext in (".xlsx", ".xls", ".xlsm", ".ods"):
-        return _read_excel(filepath) if openpyxl else ""
+def sanitize_text(text):
+    """
+    Remove or replace odd/control characters and ensure UTF-8 friendly content.
+    - Normalize unicode to NFC form.
+    - Remove non-printable control characters except for newlines/tabs.
+    """
+    return _sanitize_chunk(text).strip()
 
-    if ext in (".ppt", ".pptx", ".odp"):
-        logger.warning("Parsing for PPT/ODP not implemented.")
-        return ""
 
-    if ext == ".ipynb":
-        return _read_ipynb(filepath)
+class _OutputError(Exception):
+    """Writing extracted text failed; unlike a parse error this is not per-file."""
 
-    return ""
 
+class _SanitizingWriter:
+    """
+    File-like wrapper that sanitizes text on its way to out_fh, so readers
+    can stream pages/rows to disk instead of building the whole document.
+    Leading and trailing whitespace of the complete stream is dropped, as
+    sanitize_text() does for a whole document.
+    """
 
-def _read_plaintext(filepath):
+    def __init__(self, out_fh):
+        self._out = out_fh
+        self._pending = []  # trailing whitespace, held back until more text follows
+        self.wrote_text = False
+
+    def write(self, text):
+        text = _sanitize_chunk(text)
+        body = text.rstrip()
+        if not body:
+            # Collected, not concatenated: long runs of blank rows stay linear
+            if self.wrote_text and text:
+                self._pending.append(text)
+            return
+        tail = text[len(body):]
+        if not self.wrote_text:
+            body = body.lstrip()
+        if self._pending:
+            self._pending.append(body)
+            body = "".join(self._pending)
+        self._pending = [tail] if tail else []
+        try:
+            self._out.write(body)
+        except OSError as e:
+            raise _OutputError(e) from e
+        self.wrote_text = True
+
+    def write_clean_bytes(self, buf):
+        """
+        Write an entire document that is already known to be sanitized and
+        stripped UTF-8, bypassing the decode/sanitize/encode round trip.
+        """
+        try:
+            self._out.flush()
+            self._out.buffer.write(buf)
+        except OSError as e:
+            raise _OutputError(e) from e
+        self.wrote_text = self.wrote_text or len(buf) > 0
+
+    def discard(self):
+        """Throw away everything written so far, e.g. after a decode error."""
+        self._out.seek(0)
+        self._out.truncate()
+        self._pending = []
+        self.wrote_text = False
+
+
+def extract_text_from_file(filepath, out_fh=None, data=None):
+    """
+    Attempt to extract text from the given filepath, based on extension,
+    writing it to out_fh as it is read.
+    If data is given it holds the file's bytes, already read into memory,
+    and the file itself is not opened again.
+    Returns False if parsing failed part-way (the error is logged); whatever
+    reached out_fh by then is incomplete and should be discarded.
+    Without out_fh the text is returned as a string instead, or an empty
+    string if no parser is available or parsing fails.
+    """
+    if out_fh is None:
+        buf = io.StringIO()
+        if not extract_text_from_file(filepath, buf, data):
+            return ""
+        return buf.getvalue()
+
+    match = _EXT_RE.search(filepath)
+    category = match.lastgroup if match else None
+    if category in _SIGNATURES:
+        category = _check_signature(filepath, category, data)
+    handler = _HANDLERS.get(category)
+    if handler is None:
+        return True
+    # One handler for every reader: parsers raise all sorts of exception
+    # types on bad input, and one broken file must not stop the batch.
     try:
-        with open(filepath, "r", encoding="utf-8") as f:
-            return f.read()
+        handler(filepath, out_fh, data)
+    except _OutputError:
+        raise
     except Exception as e:
-        logger.error("Error reading plaintext file %s: %s", filepath, e)
-        return ""
+        logger.error("Error reading %s file %s: %s", category, filepath, e,
+                     exc_info=logger.isEnabledFor(logging.DEBUG))
+        return False
+    return True
 
 
-def _read_docx(filepath):
+def _check_signature(filepath, category, data=None):
+    """
+    Compare a container file's leading bytes with what its extension promises.
+    Returns the category to parse it as (a PDF under another name is still
+    read as a PDF), or None if the file should be skipped.
+    """
     try:
-        doc = docx.Document(filepath)
-        paragraphs = [p.text for p in doc.paragraphs]
-        return "\n".join(paragraphs)
-    except Exception as e:
-        logger.error("Error reading DOCX %s: %s", filepath, e)
-        return ""
+        if data is not None:
+            head = bytes(data[:_SIGNATURE_PEEK])
+        else:
+            with open(filepath, "rb") as f:
+                head = f.read(_SIGNATURE_PEEK)
+    except OSError:
+        return category  # let the reader report it
+    if category == "pdf":
+        matches = _PDF_MAGIC in head
+    else:
+        matches = head.startswith(_SIGNATURES[category])
+    if matches:
+        return category
+    if head.startswith(_PDF_MAGIC):
+        return "pdf"
+    logger.warning("Skipping %s: contents do not match its extension", filepath)
+    return None
+
+
+def _open_as_bytesio(filepath, data=None):
+    """
+    Read a whole container file (DOCX/XLSX/ODT) into memory through one mmap,
+    so the zip reader seeks within a buffer instead of issuing a syscall per
+    central-directory lookup. Inputs are already capped by max_file_size.
+    """
+    if data is not None:
+        return io.BytesIO(data)
+    with open(filepath, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return io.BytesIO(mm)
 
 
-def _read_pdf_pymupdf(filepath):
-    text_pages = []
-    try:
-        with fitz.open(filepath) as pdf_doc:
-            for page in pdf_doc:
-                text_pages.append(page.get_text())
-    except Exception as e:
-        logger.error("Error reading PDF (PyMuPDF) %s: %s", filepath, e)
-    return "\n".join(text_pages)
+def _read_unsupported(filepath, out_fh, data=None):
+    ext = os.path.splitext(filepath)[1].lower()
+    logger.warning("Native reading not implemented for %s; consider external tools.", ext)
 
 
-def _read_pdf_pypdf2(filepath):
-    text_pages = []
+def _write_if_clean(buf, out_fh):
+    """
+    Fast path for plain text made only of printable ASCII, tabs and LF:
+    sanitizing would not change it, so the bytes (minus surrounding
+    whitespace) go straight to the output. Returns False if buf needs the
+    normal decode + sanitize path.
+    """
+    write_clean_bytes = getattr(out_fh, "write_clean_bytes", None)
+    if write_clean_bytes is None or _UNCLEAN_BYTES_RE.search(buf):
+        return False
+    first = _NON_SPACE_BYTES_RE.search(buf)
+    if first:
+        end = len(buf)
+        while buf[end - 1] in b" \t\n":
+            end -= 1
+        with memoryview(buf) as view, view[first.start():end] as body:
+            write_clean_bytes(body)
+    return True
+
+
+def _decode_text(raw):
+    # Same result as reading in text mode: strict UTF-8, universal newlines
+    text = bytes(raw).decode("utf-8")
+    if "\r" in text:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return text
+
+
+def _decode_fallback(raw, filepath):
+    # Only reached when strict UTF-8 failed. A file that is UTF-8 apart from
+    # a few stray bytes stays UTF-8; otherwise open-ended detection often
+    # misreads short western text (cp1252 as cp1250, latin-1 as cp1006), so
+    # the common western code pages are tried first on their own.
+    raw = bytes(raw)
+    text = raw.decode("utf-8", errors="replace")
+    bad = text.count("\ufffd")
+    non_ascii = len(text) - len(text.encode("ascii", "ignore"))
+    best = None
+    if non_ascii - bad < _UTF8_MIN_VALID_PER_BAD * bad and charset_normalizer:
+        best = (charset_normalizer.from_bytes(raw, cp_isolation=_WESTERN_ENCODINGS).best()
+                or charset_normalizer.from_bytes(raw).best())
+    if best is not None:
+        logger.warning("%s is not valid UTF-8; decoding it as %s", filepath, best.encoding)
+        text = str(best)
+    else:
+        logger.warning("%s is not valid UTF-8; replacing %d undecodable sequence(s)", filepath, bad)
+    if "\r" in text:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return text
+
+
+def _split_for_nfc(text):
+    """
+    Split text before its last ASCII character. ASCII never composes with
+    what precedes it, so NFC-normalizing the parts separately matches
+    normalizing them together; the tail is carried into the next chunk.
+    """
+    i = len(text) - 1
+    while i >= 0 and text[i] >= "\x80":
+        i -= 1
+    if i < 0:
+        return "", text
+    return text[:i], text[i:]
+
+
+def _write_plaintext(buf, out_fh, filepath):
+    if _write_if_clean(buf, out_fh):
+        return
+    discard = getattr(out_fh, "discard", None)
+    if len(buf) <= _PLAINTEXT_STREAM_MIN_BYTES or discard is None:
+        try:
+            text = _decode_text(buf)
+        except UnicodeDecodeError:
+            text = _decode_fallback(buf, filepath)
+        out_fh.write(text)
+        return
+
+    # Large file: decode and sanitize in 64 KB pieces that stay cache-hot,
+    # instead of materializing the whole text (and its copies) at once.
+    decoder = io.IncrementalNewlineDecoder(codecs.getincrementaldecoder("utf-8")(), translate=True)
+    tail = ""  # held back so combining marks at the next chunk's start still compose
     try:
+        with memoryview(buf) as view:
+            for start in range(0, len(view), _DECODE_CHUNK_SIZE):
+                with view[start:start + _DECODE_CHUNK_SIZE] as chunk:
+                    text, tail = _split_for_nfc(tail + decoder.decode(bytes(chunk)))
+                out_fh.write(text)
+        out_fh.write(tail + decoder.decode(b"", final=True))
+    except UnicodeDecodeError:
+        discard()  # start over with the detected encoding
+        out_fh.write(_decode_fallback(buf, filepath))
+
+
+def _read_plaintext(filepath, out_fh, data=None):
+    if data is not None:
+        _write_plaintext(data, out_fh, filepath)
+        return
+    with open(filepath, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            _write_plaintext(mm, out_fh, filepath)
+
+
+def _iterparse_tag(source, tag):
+    """Yield each element with the given tag once its end tag has been parsed."""
+    if lxml_etree:
+        for _, elem in lxml_etree.iterparse(source, tag=tag):
+            yield elem
+    else:
+        for _, elem in ElementTree.iterparse(source):
+            if elem.tag == tag:
+                yield elem
+
+
+def _read_docx(filepath, out_fh, data=None):
+    # Paragraphs are read straight from word/document.xml rather than through
+    # python-docx's object model, and cleared once written to bound memory.
+    with zipfile.ZipFile(_open_as_bytesio(filepath, data)) as zf, \
+            zf.open("word/document.xml") as xml_f:
+        write = out_fh.write
+        for para in _iterparse_tag(xml_f, _W_P):
+            parts = []
+            for run in para.iter(_W_R):
+                for child in run:
+                    if child.tag == _W_T:
+                        parts.append(child.text or "")
+                    elif child.tag in _W_RUN_CHARS:
+                        parts.append(_W_RUN_CHARS[child.tag])
+            write("".join(parts))
+            write("\n")
+            para.clear()
+
+
+def _read_pdf(filepath, out_fh, data=None):
+    # PyPDF2 is many times slower than PyMuPDF, so it is only used on request.
+    if fitz:
+        _read_pdf_pymupdf(filepath, out_fh, data)
+    elif PyPDF2 and os.environ.get("FILE2TXT_ALLOW_PYPDF2"):
+        _read_pdf_pypdf2(filepath, out_fh, data)
+    else:
+        logger.warning(
+            "PyMuPDF not installed; cannot parse PDFs "
+            "(set FILE2TXT_ALLOW_PYPDF2=1 to fall back to PyPDF2)."
+        )
+
+
+def _read_pdf_pymupdf(filepath, out_fh, data=None):
+    # Pages go straight to out_fh; pages read before an error are kept.
+    pdf_source = fitz.open(filepath) if data is None else fitz.open(stream=data, filetype="pdf")
+    with pdf_source as pdf_doc:
+        for page in pdf_doc:
+            out_fh.write(page.get_text("text"))
+            out_fh.write("\n")
+
+
+def _read_pdf_pypdf2(filepath, out_fh, data=None):
+    with _open_as_bytesio(filepath, data) as f:
+        pdf = PyPDF2.PdfReader(f)
+        for page in pdf.pages:
+            out_fh.write(page.extract_text() or "")
+            out_fh.write("\n")
+
+
+def _write_odf_text(node, write):
+    # Same unwrapping as odf.teletype.extractText, but one pass over the whole
+    # body instead of one walk (and one string) per paragraph.
+    for child in node.childNodes:
+        if child.nodeType == odf.element.Node.TEXT_NODE:
+            write(child.data)
+        elif child.nodeType == odf.element.Node.ELEMENT_NODE:
+            qname = child.qname
+            if qname in _ODF_CHARS:
+                write(_ODF_CHARS[qname])
+            elif qname == _ODF_SPACE:
+                write(" " * int(child.getAttribute("c") or 1))
+            else:
+                _write_odf_text(child, write)
+                if qname in _ODF_BLOCKS:
+                    write("\n")
+
+
+def _read_odt(filepath, out_fh, data=None):
+    doc = odf.opendocument.load(_open_as_bytesio(filepath, data))
+    _write_odf_text(doc.body, out_fh.write)
+
+
+def _read_excel(filepath, out_fh, data=None):
+    # Rows are written as they are parsed, so memory stays at one row.
+    wb = openpyxl.load_workbook(_open_as_bytesio(filepath, data), read_only=True, data_only=True)
+    write, sep = out_fh.write, "\t".join
+    for name in wb.sheetnames:
+        sheet = wb[name]
+        if ((sheet.max_column or 0) > _EXCEL_MAX_TRUSTED_COLS
+                or (sheet.max_row or 0) > _EXCEL_MAX_TRUSTED_ROWS):
+            # No data is lost: rows just stop being padded to the declared size
+            sheet.reset_dimensions()
+        for row in sheet.iter_rows(values_only=True):
+            write(sep(["" if x is None else str(x) for x in row]) + "\n")
+
+
+def _read_ipynb(filepath, out_fh, data=None):
+    if data is None:
         with open(filepath, "rb") as f:
-            pdf = PyPDF2.PdfReader(f)
-            for page_num in range(len(pdf.pages)):
-                text_pages.append(pdf.pages[page_num].extract_text() or "")
-    except Exception as e:
-        logger.error("Error reading PDF (PyPDF2) %s: %s", filepath, e)
-    return "\n".join(text_pages)
+            data = f.read()
+    notebook = orjson.loads(data) if orjson else json.loads(data)
+    write = out_fh.write
+    for cell in notebook.get("cells", []):
+        # Raw cells hold unrendered output-format payloads, not content
+        if cell.get("cell_type") not in ("code", "markdown"):
+            continue
+        src = cell.get("source", [])
+        write(src if isinstance(src, str) else "".join(src))
+        write("\n")
+
+
+# Category -> reader. Formats whose optional library is missing are left out
+# and yield no text.
+_HANDLERS = {
+    "plaintext": _read_plaintext,
+    "pdf": _read_pdf,
+    "docx": _read_docx,
+    "ipynb": _read_ipynb,
+    "unsupported": _read_unsupported,
+}
+if odf:
+    _HANDLERS["odt"] = _read_odt
+if openpyxl:
+    _HANDLERS["excel"] = _read_excel
+
+
+def _iter_files(root, pattern, skip_hidden):
+    """
+    Yield (path, stat_result) for regular files under root whose name
+    matches the compiled regex `pattern`. Uses os.scandir with an explicit
+    stack, so names and file types come straight from the directory listing
+    and only matching files are stat'ed.
+    Symlinked directories are not followed (same as os.walk).
+    """
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as it:
+                entries = list(it)
+        except OSError as e:
+            logger.warning("Could not list directory %s: %s", directory, e)
+            continue
+
+        for entry in entries:
+            if skip_hidden and entry.name.startswith("."):
+                continue
+            try:
+                if entry.is_dir():
+                    if not entry.is_symlink():
+                        stack.append(entry.path)
+                    continue
+                # Skips FIFOs, sockets etc., which would block or fail on open
+                if not entry.is_file() or not pattern.search(entry.name):
+                    continue
+                st = entry.stat()
+            except OSError as e:
+                logger.error("Could not check file size of %s: %s", entry.path, e)
+                continue
+            yield entry.path, st
 
 
-def _read_odt(filepath):
-    try:
-        doc = odf.opendocument.load(filepath)
-        text_elements = doc.getElementsByType(odf.text.P)
-        paragraphs = [odf.teletype.extractText(elem) for elem in text_elements]
-        return "\n".join(paragraphs)
-    except Exception as e:
-        logger.error("Error reading ODT %s: %s", filepath, e)
-        return ""
+class _ExtractionCache:
+    """
+    SQLite record of converted sources, keyed by (path relative to the input
+    dir, sha256 of the contents). A source whose hash is unchanged and whose
+    .txt is still the one we wrote does not need to be parsed again.
+    """
 
+    def __init__(self, output_dir):
+        self._conn = sqlite3.connect(os.path.join(output_dir, CACHE_FILE_NAME))
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS extracted ("
+            "path TEXT, sha TEXT, out_mtime REAL, PRIMARY KEY(path, sha))"
+        )
+
+    def entries(self):
+        """Return {path: (sha, out_mtime)} for everything recorded so far."""
+        rows = self._conn.execute("SELECT path, sha, out_mtime FROM extracted")
+        return {path: (sha, out_mtime) for path, sha, out_mtime in rows}
+
+    def record(self, path, sha, out_mtime):
+        self._conn.execute("DELETE FROM extracted WHERE path = ?", (path,))
+        self._conn.execute(
+            "INSERT INTO extracted (path, sha, out_mtime) VALUES (?, ?, ?)",
+            (path, sha, out_mtime),
+        )
+
+    def close(self):
+        self._conn.commit()
+        self._conn.close()
+
+
+def _file_sha256(filepath):
+    with open(filepath, "rb") as f:
+        if hasattr(hashlib, "file_digest"):  # Python 3.11+
+            return hashlib.file_digest(f, "sha256").hexdigest()
+        digest = hashlib.sha256()
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+        return digest.hexdigest()
+
+
+def _prefetch(items, depth=8):
+    """
+    Yield (item, data) for each work item, with the source file's bytes read
+    by a background thread up to `depth` files ahead, so disk reads overlap
+    with parsing. data is None if the read failed; the reader then opens the
+    file itself and reports the error.
+    """
+    pending = queue.Queue(maxsize=depth)
+    done = object()
 
-def _read_excel(filepath):
-    try:
-        wb = openpyxl.load_workbook(filepath, read_only=True, data_only=True)
-        text_chunks = []
-        for name in wb.sheetnames:
-            sheet = wb[name]
-            for row in sheet.iter_rows(values_only=True):
-                row_str = "\t".join(str(x) if x is not None else "" for x in row)
-                text_chunks.append(row_str)
-        return "\n".join(text_chunks)
-    except Exception as e:
-        logger.error("Error reading Excel file %s: %s", filepath, e)
-        return ""
+    def read_ahead():
+        for item in items:
+            try:
+                with open(item[0], "rb") as f:
+                    data = f.read()
+            except OSError:
+                data = None
+            pending.put((item, data))
+        pending.put(done)
+
+    threading.Thread(target=read_ahead, daemon=True).start()
+    while True:
+        entry = pending.get()
+        if entry is done:
+            return
+        yield entry
+
+
+def _warm_up_worker():
+    """
+    ProcessPoolExecutor initializer: render a one-page in-memory PDF so
+    PyMuPDF's one-time font and text-extraction setup is paid once per
+    worker, before its first real file.
+    """
+    if fitz:
+        try:
+            with fitz.open() as pdf_doc:
+                pdf_doc.new_page().insert_text((72, 72), "warm-up")
+                pdf_doc[0].get_text()
+        except Exception as e:
+            logger.debug("PyMuPDF warm-up failed: %s", e)
 
 
-def _read_ipynb(filepath):
+def _convert_one(item, data=None):
+    """
+    Extract, sanitize and write a single file.
+    Runs inside a worker process, so the outcome is returned to the parent
+    for logging as (full_path, out_path, status, error, sha).
+    If use_cache is set the source is hashed first, and a hash equal to
+    cached_sha means the existing output is still valid. data optionally
+    holds the source bytes, already read by _prefetch.
+    """
+    full_path, out_path, use_cache, cached_sha = item
+    sha = None
+    # Text goes to a temp file next to the .txt and is only moved into place
+    # once something was written, so sources sharing a stem (x.pdf, x.docx)
+    # never truncate or delete each other's output.
+    out_dir, out_name = os.path.split(out_path)
+    tmp_path = os.path.join(out_dir, ".%s.%d.tmp" % (out_name, os.getpid()))
     try:
-        with open(filepath, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        text_cells = []
-        for cell in data.get("cells", []):
-            src = cell.get("source", [])
-            text_cells.append("".join(src))
-        return "\n".join(text_cells)
+        if use_cache:
+            if data is None:
+                sha = _file_sha256(full_path)
+            else:
+                sha = hashlib.sha256(data).hexdigest()
+            if sha == cached_sha:
+                return full_path, out_path, "cached", None, sha
+
+        # Write to .txt in UTF-8, sanitizing as the reader streams text in
+        with open(tmp_path, "w", encoding="utf-8", buffering=_WRITE_BUFFER_SIZE) as out_f:
+            writer = _SanitizingWriter(out_f)
+            complete = extract_text_from_file(full_path, writer, data)
+        if not complete:
+            # Partial text would look up to date to the mtime skip; keep the
+            # old .txt (if any), which stays older than the source and is retried
+            return full_path, out_path, "failed", None, sha
+        if not writer.wrote_text:
+            return full_path, out_path, "empty", None, sha
+        os.replace(tmp_path, out_path)
+        return full_path, out_path, "written", None, sha
     except Exception as e:
-        logger.error("Error reading IPYNB %s: %s", filepath, e)
-        return ""
+        return full_path, out_path, "error", str(e), sha
+    finally:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+
+def _report(result):
+    full_path, out_path, status, error, _ = result
+    if status == "written":
+        logger.info("Wrote text to %s", out_path)
+    elif status == "cached":
+        logger.debug("Unchanged since last run, keeping %s", out_path)
+    elif status == "empty":
+        logger.debug("No text extracted (or only control chars) from %s", full_path)
+    elif status == "failed":
+        logger.debug("Reading %s failed (logged above), leaving %s as it was", full_path, out_path)
+    else:
+        logger.error("Error writing to %s: %s", out_path, error)
 
 
 def convert_files_to_txt(
     input_dir,
     output_dir,
     max_file_size=5 * 1024 * 1024,
-    skip_hidden=True
+    skip_hidden=True,
+    workers=DEFAULT_WORKERS,
+    use_cache=True,
+    force=False
 ):
     """
     Recursively scan input_dir for files, extract & sanitize text,
     then write them as .txt in output_dir.
+    Files are converted in parallel by `workers` processes (1 = in-process).
+    Sources older than their existing .txt are skipped, as are (with
+    use_cache) sources whose content hash matches the previous run; force
+    converts everything regardless.
     """
     if not os.path.exists(output_dir):
         os.makedirs(output_dir, exist_ok=True)
 
     logger.info("Starting conversion from %s to %s", input_dir, output_dir)
 
-    allowed_extensions = (
-        ".txt", ".md", ".py", ".json", ".csv", ".tsv", ".log", ".xml",
-        ".yaml", ".yml", ".html", ".htm", ".css", ".js", ".jsx", ".ts",
-        ".tsx", ".sh", ".cmd", ".ps1", ".swift", ".kt", ".go", ".rs",
-        ".lua", ".pl", ".r", ".m", ".vb", ".cs", ".asm", ".dart",
-        ".php", ".rb", ".sql", ".doc", ".docx", ".rtf", ".pdf",
-        ".odt", ".xls", ".xlsx", ".xlsm", ".ods", ".ppt", ".pptx",
-        ".odp", ".ipynb"
-    )
-
-    for root, dirs, files in os.walk(input_dir):
-        if skip_hidden:
-            dirs[:] = [d for d in dirs if not d.startswith(".")]
+    cache = _ExtractionCache(output_dir) if use_cache else None
+    known = cache.entries() if cache else {}
 
-        for file_name in files:
-            if skip_hidden and file_name.startswith("."):
-                continue
+    items = []
+    made_dirs = set()
+    for full_path, st in _iter_files(input_dir, _EXT_RE, skip_hidden):
+        if st.st_size > max_file_size:
+            logger.debug("Skipping large file %s (size %d bytes)", full_path, st.st_size)
+            continue
 
-            ext = os.path.splitext(file_name)[1].lower()
-            if ext not in allowed_extensions:
-                continue
+        # e.g. my_docs/foo/bar.pdf -> output_dir/foo/bar.txt
+        rel_path = os.path.relpath(full_path, input_dir)
+        base_name = os.path.splitext(rel_path)[0]  # no extension
+        txt_rel_path = f"{base_name}.txt"
+        out_path = os.path.join(output_dir, txt_rel_path)
 
-            full_path = os.path.join(root, file_name)
-            # Check file size
+        if not force:
             try:
-                size = os.path.getsize(full_path)
-                if size > max_file_size:
-                    logger.debug("Skipping large file %s (size %d bytes)", full_path, size)
+                if os.path.getmtime(out_path) >= st.st_mtime:
+                    logger.debug("Up to date, skipping %s", full_path)
                     continue
-            except Exception as e:
-                logger.error("Could not check file size of %s: %s", full_path, e)
-                continue
+            except OSError:
+                pass
 
-            # e.g. my_docs/foo/bar.pdf -> output_dir/foo/bar.txt
+        # Only trust a cache entry if the .txt is still the one we wrote
+        cached_sha = None
+        if rel_path in known and not force:
+            sha, out_mtime = known[rel_path]
+            try:
+                if os.path.getmtime(out_path) == out_mtime:
+                    cached_sha = sha
+            except OSError:
+                pass
+
+        out_dir = os.path.dirname(out_path)
+        if out_dir not in made_dirs:
+            os.makedirs(out_dir, exist_ok=True)
+            made_dirs.add(out_dir)
+        items.append((full_path, out_path, use_cache, cached_sha))
+
+    def handle(result):
+        _report(result)
+        full_path, out_path, status, _, sha = result
+        if status not in ("written", "cached"):
+            return
+        try:
+            if status == "cached":
+                # Content is unchanged; bump the .txt so the mtime check skips it next time
+                os.utime(out_path)
+            out_mtime = os.path.getmtime(out_path)
+        except OSError as e:
+            # Another source with the same stem may have replaced or removed it
+            logger.debug("Could not update %s: %s", out_path, e)
+            return
+        if cache:
             rel_path = os.path.relpath(full_path, input_dir)
-            base_name = os.path.splitext(rel_path)[0]  # no extension
-            txt_rel_path = f"{base_name}.txt"
-            out_path = os.path.join(output_dir, txt_rel_path)
+            cache.record(rel_path, sha, out_mtime)
 
-            os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    try:
+        if workers > 1 and len(items) > 1:
+            # Batch up to 16 files per task, but keep ~4 batches per worker
+            # so small runs still spread evenly.
+            chunksize = max(1, min(16, len(items) // (workers * 4)))
+            with ProcessPoolExecutor(max_workers=workers, initializer=_warm_up_worker) as executor:
+                for result in executor.map(_convert_one, items, chunksize=chunksize):
+                    handle(result)
+        else:
+            # Single process: read the next files while the current one is parsed
+            for item, data in _prefetch(items):
+                handle(_convert_one(item, data))
+    finally:
+        if cache:
+            cache.close()
 
-            raw_text = extract_text_from_file(full_path)
-            sanitized_text = sanitize_text(raw_text)
-            if not sanitized_text:
-                logger.debug("No text extracted (or only control chars) from %s", full_path)
-                continue
+    logger.info("Conversion complete.")
 
-            # Write to .txt in UTF-8
-            try:
-                with open(out_path, "w", encoding="utf-8") as out_f:
-                    out_f.write(sanitized_text)
-                logger.info("Wrote text to %s", out_path)
-            except Exception as e:
-                logger.error("Error writing to %s: %s", out_path, e)
 
-    logger.info("Conversion complete.")
+@contextlib.contextmanager
+def _isal_deflate():
+    """
+    Temporarily route zipfile's DEFLATE and CRC-32 through ISA-L, which uses
+    SIMD/PCLMUL and is several times faster than zlib. The archive is
+    still a standard zip.
+    """
+    saved = zipfile.zlib, zipfile.crc32
+    zipfile.zlib, zipfile.crc32 = isal_zlib, isal_zlib.crc32
+    try:
+        yield
+    finally:
+        zipfile.zlib, zipfile.crc32 = saved
 
 
-def zip_output_dir(output_dir, zip_name="converted_files.zip"):
+def zip_output_dir(output_dir, zip_name="converted_files.zip", level=1, archive_format="zip"):
     """
     Zip the entire output directory of .txt files into a single archive.
+    level 0 stores files uncompressed; higher levels trade CPU for size.
+    archive_format "zstd" writes a multi-threaded zstd-compressed tarball
+    (.tar.zst) instead, which is much faster than DEFLATE for large outputs.
     """
+    txt_files = _iter_files(output_dir, _TXT_RE, skip_hidden=False)
+
+    if archive_format == "zstd":
+        if not zstandard:
+            logger.error("zstandard is not installed; cannot write a .tar.zst archive.")
+            return
+        if zip_name.endswith(".zip"):
+            zip_name = zip_name[:-len(".zip")] + ".tar.zst"
+        zip_path = os.path.join(os.path.dirname(output_dir), zip_name)
+        logger.info("Archiving all text files in %s -> %s", output_dir, zip_path)
+
+        compressor = zstandard.ZstdCompressor(level=max(level, 1), threads=-1)
+        with open(zip_path, "wb") as raw, compressor.stream_writer(raw) as zst, \
+                tarfile.open(fileobj=zst, mode="w|") as tar:
+            for full_path, _ in txt_files:
+                tar.add(full_path, arcname=os.path.relpath(full_path, output_dir))
+
+        logger.info("Created zstd archive at %s", zip_path)
+        return
+
     zip_path = os.path.join(os.path.dirname(output_dir), zip_name)
     logger.info("Zipping all text files in %s -> %s", output_dir, zip_path)
 
-    with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zf:
-        for root, dirs, files in os.walk(output_dir):
-            for file_name in files:
-                if file_name.endswith(".txt"):
-                    full_path = os.path.join(root, file_name)
-                    rel_path = os.path.relpath(full_path, output_dir)
-                    zf.write(full_path, arcname=rel_path)
+    deflate = contextlib.nullcontext()
+    if level == 0:
+        compression, compresslevel = zipfile.ZIP_STORED, None
+    elif isal_zlib:
+        # ISA-L only has levels 0-3; 3 is its best compression
+        compression, compresslevel = zipfile.ZIP_DEFLATED, min(level, isal_zlib.ISAL_BEST_COMPRESSION)
+        deflate = _isal_deflate()
+    else:
+        compression, compresslevel = zipfile.ZIP_DEFLATED, level
+    with deflate, zipfile.ZipFile(zip_path, "w", compression, compresslevel=compresslevel) as zf:
+        for full_path, _ in txt_files:
+            zf.write(full_path, arcname=os.path.relpath(full_path, output_dir))
 
     logger.info("Created zip archive at %s", zip_path)
 
@@ -300,10 +972,21 @@ def parse_args():
     parser.add_argument("output_dir", help="Directory to store .txt files")
     parser.add_argument("--zip", nargs="?", const="converted_files.zip", default=None,
                         help="If set, zip the output directory after conversion. Optionally specify a ZIP filename.")
+    parser.add_argument("--zip-level", type=int, choices=(0, 1, 6), default=1,
+                        help="Compression level for --zip: 0 stores, 1 is fast (default), 6 is smaller.")
+    parser.add_argument("--zip-format", choices=("zip", "zstd"), default="zip",
+                        help="Archive format for --zip. 'zstd' writes a .tar.zst (requires zstandard).")
     parser.add_argument("--max-file-size", type=int, default=5 * 1024 * 1024,
                         help="Skip files larger than this (in bytes). Default is 5MB.")
     parser.add_argument("--include-hidden", action="store_true",
                         help="If set, process hidden files & directories.")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help=f"Number of worker processes. Default is {DEFAULT_WORKERS}; use 1 to disable.")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="If set, don't use the content-hash cache; files whose .txt is newer than "
+                             "the source are still skipped (use --force to re-parse everything).")
+    parser.add_argument("--force", action="store_true",
+                        help="If set, convert every file even if its .txt is newer than the source.")
     return parser.parse_args()
 
 
@@ -314,12 +997,15 @@ def main():
         input_dir=args.input_dir,
         output_dir=args.output_dir,
         max_file_size=args.max_file_size,
-        skip_hidden=not args.include_hidden
+        skip_hidden=not args.include_hidden,
+        workers=args.workers,
+        use_cache=not args.no_cache,
+        force=args.force
     )
 
     # If requested, zip the resulting .txt files
     if args.zip:
-        zip_output_dir(args.output_dir, args.zip)
+        zip_output_dir(args.output_dir, args.zip, level=args.zip_level, archive_format=args.zip_format)
 
 
 if __name__ == "__main__":
@@ -12,11 +12,21 @@ setup(
     ],
     extras_require={
         "parsers": [
-            "python-docx",
             "PyMuPDF",
-            "PyPDF2",
+            "lxml",
             "openpyxl",
             "odfpy",
+            "orjson",
+            "charset-normalizer",
+        ],
+        "legacy_pdf": [
+            "PyPDF2",
+        ],
+        "zstd": [
+            "zstandard",
+        ],
+        "isal": [
+            "isal",
         ],
     },
     entry_points={